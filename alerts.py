@@ -0,0 +1,256 @@
+import argparse
+import json
+import operator
+import sqlite3
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# Varslingsregler lagret i databasen, evaluert etter hver oppdatering.
+# Bare tickere som faktisk endret seg i kjøringen (change_log) sjekkes, og bare
+# mot regler som bruker et av de endrede feltene. Et varsel sendes én gang per
+# kryssing (tilstand i alert_state) og havner i alert_outbox (evt. også en fil).
+#
+#   python alerts.py add targetPercent ">" 30
+#   python alerts.py add mom_1d "<" -8 --ticker NVDA
+#   python alerts.py watch NVDA AAPL
+#   python alerts.py list
+#   python alerts.py outbox
+
+OPS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+DB_PATH = "aksjeradar.db"  # bare for CLI-en; updatedb.py sender inn sin egen tilkobling
+OUTBOX_FILE = None  # f.eks. "alerts_outbox.jsonl" for å også skrive varsler til fil
+
+# Avledede felt: navn -> (felt de avhenger av, funksjon av raden)
+DERIVED = {
+    "targetPercent": (
+        ("target", "price"),
+        lambda r: (r["target"] - r["price"]) / r["price"] * 100
+        if r.get("target") is not None and r.get("price") else None,
+    ),
+}
+
+
+def ensure_alert_tables(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS alert_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        field TEXT NOT NULL,
+        op TEXT NOT NULL,            -- '>', '>=', '<', '<='
+        threshold REAL NOT NULL,
+        ticker TEXT,                 -- NULL = alle tickere i watchlist
+        enabled INTEGER DEFAULT 1,
+        created TEXT
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS watchlist (
+        ticker TEXT PRIMARY KEY
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS alert_state (
+        rule_id INTEGER NOT NULL,
+        ticker TEXT NOT NULL,
+        active INTEGER NOT NULL,     -- 1 = betingelsen er oppfylt nå
+        run_id INTEGER,              -- kjøringen som sist endret tilstanden
+        PRIMARY KEY (rule_id, ticker)
+    ) WITHOUT ROWID""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS alert_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created TEXT,
+        run_id INTEGER,
+        rule_id INTEGER,
+        ticker TEXT,
+        field TEXT,
+        value REAL,
+        message TEXT,
+        delivered INTEGER DEFAULT 0
+    )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS alert_outbox_pending ON alert_outbox (delivered, id)")
+
+
+# Kolonner i stock_data som ikke spores i change_log eller ikke er tall
+UNTRACKED = {"ticker", "timestamp", "hidden", "name", "sector", "industry"}
+
+
+def alert_fields(conn):
+    """Felt en regel kan bruke: numeriske kolonner i stock_data (de updatedb.py
+    sporer i change_log) og avledede felt."""
+    existing = {r[1] for r in conn.execute("PRAGMA table_info(stock_data)")}
+    return (existing - UNTRACKED) | set(DERIVED)
+
+
+def add_rule(conn, field, op, threshold, ticker=None):
+    if op not in OPS:
+        raise ValueError(f"Ukjent operator {op}")
+    fields = alert_fields(conn)
+    if field not in fields:
+        # En skrivefeil ville ellers gitt en regel som aldri utløses
+        raise ValueError(f"Ukjent felt {field} (gyldige: {', '.join(sorted(fields))})")
+    ensure_alert_tables(conn)
+    ticker = ticker.strip().upper() if ticker else None  # som i change_log / watchlist
+    cur = conn.execute(
+        "INSERT INTO alert_rules (field, op, threshold, ticker, created) VALUES (?, ?, ?, ?, ?)",
+        (field, op, float(threshold), ticker, datetime.now(timezone.utc).isoformat()),
+    )
+    conn.commit()
+    return cur.lastrowid
+
+
+def _index_rules(conn):
+    """Regler indeksert på lagret felt -> ticker (None = watchlist) -> regler.
+    Avledede felt indekseres på kildefeltene sine."""
+    index = defaultdict(lambda: defaultdict(list))
+    for rule_id, field, op, threshold, ticker in conn.execute(
+        "SELECT id, field, op, threshold, ticker FROM alert_rules WHERE enabled = 1"
+    ):
+        rule = (rule_id, field, op, threshold)
+        for source in DERIVED[field][0] if field in DERIVED else (field,):
+            index[source][ticker].append(rule)
+    return index
+
+
+def _value(row, field):
+    if field in DERIVED:
+        return DERIVED[field][1](row)
+    return row.get(field)
+
+
+def _load_rows(conn, tickers):
+    rows = {}
+    tickers = list(tickers)
+    for i in range(0, len(tickers), 500):
+        chunk = tickers[i:i + 500]
+        cur = conn.execute(
+            f"SELECT * FROM stock_data WHERE ticker IN ({','.join('?' * len(chunk))})", chunk
+        )
+        names = [d[0] for d in cur.description]
+        for r in cur.fetchall():
+            rows[r[0]] = dict(zip(names, r))
+    return rows
+
+
+def evaluate_alerts(conn: sqlite3.Connection, run_id, outbox_file=OUTBOX_FILE):
+    """Evaluerer reglene mot tickerne som endret seg i run_id. Returnerer antall nye varsler."""
+    ensure_alert_tables(conn)
+    index = _index_rules(conn)
+    if not index:
+        return 0
+
+    # Ticker -> regler som leser et felt tickeren endret i denne kjøringen
+    watchlist = {r[0] for r in conn.execute("SELECT ticker FROM watchlist")}
+    candidates = defaultdict(set)
+    for ticker, field in conn.execute(
+        "SELECT ticker, field FROM change_log WHERE run_id = ?", (run_id,)
+    ):
+        by_ticker = index.get(field)
+        if not by_ticker:
+            continue
+        candidates[ticker].update(by_ticker.get(ticker, ()))
+        if ticker in watchlist:
+            candidates[ticker].update(by_ticker.get(None, ()))
+    candidates = {t: rules for t, rules in candidates.items() if rules}
+    if not candidates:
+        return 0
+
+    rows = _load_rows(conn, candidates)
+    keys = [(rule[0], t) for t, rules in candidates.items() for rule in rules]
+    state = {}
+    for i in range(0, len(keys), 400):
+        chunk = keys[i:i + 400]
+        for rule_id, ticker, active in conn.execute(
+            "SELECT rule_id, ticker, active FROM alert_state WHERE (rule_id, ticker) IN "
+            f"(VALUES {','.join('(?, ?)' for _ in chunk)})",
+            [v for k in chunk for v in k],
+        ):
+            state[(rule_id, ticker)] = active
+
+    now = datetime.now(timezone.utc).isoformat()
+    new_state = []
+    fired = []
+    for ticker, rules in candidates.items():
+        row = rows.get(ticker)
+        if row is None:
+            continue
+        for rule_id, field, op, threshold in rules:
+            value = _value(row, field)
+            active = int(value is not None and OPS[op](value, threshold))
+            if active == state.get((rule_id, ticker), 0):
+                continue  # ingen kryssing
+            new_state.append((rule_id, ticker, active, run_id))
+            if active:
+                msg = f"{ticker}: {field} {value:.2f} {op} {threshold:g}"
+                fired.append((now, run_id, rule_id, ticker, field, value, msg))
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO alert_state (rule_id, ticker, active, run_id) VALUES (?, ?, ?, ?)",
+        new_state,
+    )
+    conn.executemany("""
+        INSERT INTO alert_outbox (created, run_id, rule_id, ticker, field, value, message)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, fired)
+
+    if outbox_file and fired:
+        with open(outbox_file, "a", encoding="utf-8") as f:
+            for created, run, rule_id, ticker, field, value, msg in fired:
+                f.write(json.dumps({
+                    "created": created, "run_id": run, "rule_id": rule_id,
+                    "ticker": ticker, "field": field, "value": value, "message": msg,
+                }, ensure_ascii=False) + "\n")
+
+    for *_, msg in fired:
+        print(f"🔔 {msg}")
+    return len(fired)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Administrer varslingsregler.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_add = sub.add_parser("add", help="Ny regel")
+    p_add.add_argument("field")
+    p_add.add_argument("op", choices=sorted(OPS))
+    p_add.add_argument("threshold", type=float)
+    p_add.add_argument("--ticker", help="Bare denne tickeren (standard: watchlist)")
+    p_rm = sub.add_parser("remove", help="Slett regel")
+    p_rm.add_argument("id", type=int)
+    p_watch = sub.add_parser("watch", help="Legg til i watchlist")
+    p_watch.add_argument("tickers", nargs="+")
+    p_unwatch = sub.add_parser("unwatch", help="Fjern fra watchlist")
+    p_unwatch.add_argument("tickers", nargs="+")
+    sub.add_parser("list", help="Vis regler og watchlist")
+    p_out = sub.add_parser("outbox", help="Vis uleverte varsler")
+    p_out.add_argument("--ack", action="store_true", help="Merk dem som levert")
+    args = parser.parse_args()
+
+    # Egen tilkobling (som api.py): updatedb.py ville dratt inn yfinance, requests osv.
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    ensure_alert_tables(conn)
+    if args.cmd == "add":
+        try:
+            rule_id = add_rule(conn, args.field, args.op, args.threshold, args.ticker)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"✅ Regel {rule_id} lagt til.")
+    elif args.cmd == "remove":
+        conn.execute("DELETE FROM alert_rules WHERE id = ?", (args.id,))
+        conn.execute("DELETE FROM alert_state WHERE rule_id = ?", (args.id,))
+    elif args.cmd == "watch":
+        conn.executemany("INSERT OR IGNORE INTO watchlist (ticker) VALUES (?)",
+                         [(t.upper(),) for t in args.tickers])
+    elif args.cmd == "unwatch":
+        conn.executemany("DELETE FROM watchlist WHERE ticker = ?", [(t.upper(),) for t in args.tickers])
+    elif args.cmd == "list":
+        for r in conn.execute("SELECT id, field, op, threshold, COALESCE(ticker, '(watchlist)'), enabled FROM alert_rules"):
+            print(*r)
+        print("Watchlist:", ", ".join(r[0] for r in conn.execute("SELECT ticker FROM watchlist ORDER BY ticker")))
+    elif args.cmd == "outbox":
+        pending = conn.execute("SELECT id, created, message FROM alert_outbox WHERE delivered = 0 ORDER BY id").fetchall()
+        for r in pending:
+            print(*r)
+        if args.ack and pending:
+            conn.execute("UPDATE alert_outbox SET delivered = 1 WHERE id <= ?", (pending[-1][0],))
+    conn.commit()
+    conn.close()
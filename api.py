@@ -0,0 +1,331 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from changefeed import biggest_movers
+
+# Lesende JSON-API over aksjeradar.db for andre dashboards.
+#   python api.py --port 8502
+#
+#   GET /stocks?sort=targetPercent&order=desc&page=1&page_size=50
+#   GET /stocks/<ticker>
+#   GET /stocks/<ticker>/history?start=2025-01-01&end=2025-12-31
+#   GET /screens
+#   GET /screens/<navn>?page=1&page_size=50
+#   GET /movers?field=price&limit=20            (største endringer siste kjøring)
+#
+# Svarene caches i prosessen og merkes med ETag fra dataversjonen (mtime/størrelse
+# på databasefilen og WAL-filen). Uendret data gir 304 uten å åpne SQLite.
+
+DB_PATH = "aksjeradar.db"
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+VERSION_TTL = 1.0      # sekunder mellom hver stat() av databasefilene
+MAX_CACHE_ENTRIES = 2048
+
+# Kolonner API-et kan levere; eldre databaser (før ALTER TABLE-migreringen i
+# updatedb.py) mangler noen av dem, så utvalget bygges fra PRAGMA table_info.
+STOCK_COLUMNS = [
+    "ticker", "name", "price", "target", "targetLow", "targetHigh", "pe", "pb", "debt_to_equity",
+    "dividend_yield", "marketcap", "mom_1d", "mom_1m", "mom_3m", "mom_1y", "sector", "industry",
+    "sma50_dist", "sma200_dist", "rsi_14", "vol_20d", "drawdown_52w", "avg_volume_20d", "timestamp",
+]
+TARGET_PERCENT = "(target - price) / price * 100 AS targetPercent"
+SORTABLE = (set(STOCK_COLUMNS) - {"timestamp"}) | {"targetPercent"}
+
+# Ferdigdefinerte filtre: navn -> (WHERE-uttrykk, standard sortering, retning)
+SCREENS = {
+    "upside": ("target IS NOT NULL AND (target - price) / price * 100 >= 20", "targetPercent", "desc"),
+    "momentum": ("mom_3m >= 20 AND mom_1m > 0", "mom_3m", "desc"),
+    "value": ("pb > 0 AND pb < 1.5", "pb", "asc"),
+    "losers": ("mom_1d <= -5", "mom_1d", "asc"),
+    "oversold": ("rsi_14 < 30", "rsi_14", "asc"),
+    "uptrend": ("sma50_dist > 0 AND sma200_dist > 0", "sma200_dist", "desc"),
+    "near_high": ("drawdown_52w >= -5", "drawdown_52w", "desc"),
+    "calm": ("vol_20d < 25", "vol_20d", "asc"),
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# -------------------------
+# Dataversjon og cache
+# -------------------------
+class ResponseCache:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.version = None
+        self.checked = 0.0
+
+    def data_version(self):
+        now = time.monotonic()
+        with self.lock:
+            if self.version is not None and now - self.checked < VERSION_TTL:
+                return self.version
+            parts = []
+            for path in (self.db_path, self.db_path + "-wal"):
+                try:
+                    st = os.stat(path)
+                    parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+                except FileNotFoundError:
+                    parts.append("-")
+            version = "|".join(parts)
+            if version != self.version:
+                self.entries.clear()  # ny data -> alt utdatert
+                self.version = version
+            self.checked = now
+            return version
+
+    def get(self, key, build):
+        version = self.data_version()
+        with self.lock:
+            hit = self.entries.get(key)
+        if hit is not None:
+            return hit
+
+        body = json.dumps(build(), default=str, separators=(",", ":")).encode("utf-8")
+        etag = 'W/"' + hashlib.sha1(f"{version}|{key}".encode()).hexdigest()[:20] + '"'
+        entry = (etag, body, gzip.compress(body, compresslevel=6))
+        with self.lock:
+            if self.version == version:
+                if len(self.entries) >= MAX_CACHE_ENTRIES:
+                    self.entries.clear()
+                self.entries[key] = entry
+        return entry
+
+
+def read_conn(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# -------------------------
+# Spørringer
+# -------------------------
+def _int_param(params, name, default, lo, hi):
+    try:
+        value = int(params.get(name, [default])[0])
+    except ValueError:
+        raise HttpError(400, f"Ugyldig verdi for {name}")
+    return max(lo, min(hi, value))
+
+
+def _paging(params):
+    page = _int_param(params, "page", 1, 1, 10**9)
+    size = _int_param(params, "page_size", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    return page, size
+
+
+def _columns(conn):
+    """(SELECT-liste, sorterbare felt) for kolonnene som finnes i denne databasen."""
+    existing = {r[1] for r in conn.execute("PRAGMA table_info(stock_data)")}
+    cols = [c for c in STOCK_COLUMNS if c in existing]
+    return ", ".join(cols + [TARGET_PERCENT]), (SORTABLE & existing) | {"targetPercent"}
+
+
+def _order(params, default_sort, default_order="desc", sortable=SORTABLE):
+    sort = params.get("sort", [default_sort])[0]
+    if sort not in sortable:
+        raise HttpError(400, f"Kan ikke sortere på {sort}")
+    order = params.get("order", [default_order])[0].lower()
+    if order not in ("asc", "desc"):
+        raise HttpError(400, "order må være asc eller desc")
+    # NULL alltid sist, uansett retning
+    return f"{sort} IS NULL, {sort} {order.upper()}"
+
+
+def _visible(params):
+    if params.get("include_hidden", ["0"])[0] in ("1", "true"):
+        return "price IS NOT NULL"
+    return "price IS NOT NULL AND (hidden IS NULL OR hidden = 0)"
+
+
+def list_stocks(db_path, params, where="1=1", default_sort="targetPercent", default_order="desc"):
+    page, size = _paging(params)
+    cond = f"{_visible(params)} AND ({where})"
+    conn = read_conn(db_path)
+    try:
+        columns, sortable = _columns(conn)
+        if default_sort not in sortable:
+            # Screen sortert på en kolonne som ikke er migrert ennå
+            raise HttpError(404, f"Kolonnen {default_sort} finnes ikke i databasen ennå (kjør updatedb.py)")
+        order_by = _order(params, default_sort, default_order, sortable)
+        total = conn.execute(f"SELECT COUNT(*) FROM stock_data WHERE {cond}").fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {columns} FROM stock_data WHERE {cond} "
+            f"ORDER BY {order_by} LIMIT ? OFFSET ?",
+            (size, (page - 1) * size),
+        ).fetchall()
+    finally:
+        conn.close()
+    return {
+        "page": page,
+        "page_size": size,
+        "total": total,
+        "pages": max(1, (total - 1) // size + 1),
+        "items": [dict(r) for r in rows],
+    }
+
+
+def stock_detail(db_path, ticker):
+    conn = read_conn(db_path)
+    try:
+        columns, _ = _columns(conn)
+        row = conn.execute(
+            f"SELECT {columns}, hidden FROM stock_data WHERE ticker = ?", (ticker,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise HttpError(404, f"Fant ikke {ticker}")
+    return dict(row)
+
+
+def stock_history(db_path, ticker, params):
+    start = params.get("start", ["0000-00-00"])[0]
+    end = params.get("end", ["9999-99-99"])[0]
+    conn = read_conn(db_path)
+    try:
+        try:
+            rows = conn.execute(
+                "SELECT date, open, high, low, close, volume FROM price_history "
+                "WHERE ticker = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (ticker, start, end),
+            ).fetchall()
+        except sqlite3.OperationalError:
+            rows = []  # price_history finnes ikke før første backfill
+    finally:
+        conn.close()
+    return {"ticker": ticker, "bars": [dict(r) for r in rows]}
+
+
+def movers(db_path, params):
+    field = params.get("field", ["price"])[0]
+    if field not in SORTABLE:
+        raise HttpError(400, f"Ukjent felt {field}")
+    limit = _int_param(params, "limit", 20, 1, MAX_PAGE_SIZE)
+    conn = read_conn(db_path)
+    try:
+        try:
+            rows = biggest_movers(conn, field, limit)
+        except sqlite3.OperationalError:
+            rows = []  # change_log finnes ikke før første oppdatering
+    finally:
+        conn.close()
+    return {"field": field, "items": [dict(r) for r in rows]}
+
+
+def route(db_path, path, params):
+    parts = [p for p in path.split("/") if p]
+    if parts == ["stocks"]:
+        return list_stocks(db_path, params)
+    if len(parts) == 2 and parts[0] == "stocks":
+        return stock_detail(db_path, parts[1].upper())
+    if len(parts) == 3 and parts[0] == "stocks" and parts[2] == "history":
+        return stock_history(db_path, parts[1].upper(), params)
+    if parts == ["screens"]:
+        return {"screens": sorted(SCREENS)}
+    if len(parts) == 2 and parts[0] == "screens":
+        if parts[1] not in SCREENS:
+            raise HttpError(404, f"Ukjent screen {parts[1]}")
+        where, default_sort, default_order = SCREENS[parts[1]]
+        try:
+            return list_stocks(db_path, params, where, default_sort, default_order)
+        except sqlite3.OperationalError as e:
+            if "no such column" not in str(e):
+                raise
+            # Screenen bruker kolonner som ikke er migrert ennå (kjør updatedb.py)
+            raise HttpError(404, f"Screen {parts[1]} er ikke tilgjengelig: {e}")
+    if parts == ["movers"]:
+        return movers(db_path, params)
+    raise HttpError(404, "Ukjent sti")
+
+
+# -------------------------
+# HTTP
+# -------------------------
+class ApiHandler(BaseHTTPRequestHandler):
+    cache = None  # settes i serve()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        key = url.path.rstrip("/") + "?" + "&".join(
+            f"{k}={v}" for k in sorted(params) for v in params[k]
+        )
+        db_path = self.cache.db_path
+        try:
+            etag, body, body_gz = self.cache.get(key, lambda: route(db_path, url.path, params))
+        except HttpError as e:
+            self._send_error(e.status, e.message)
+            return
+        except sqlite3.Error as e:
+            self._send_error(503, f"Databasefeil: {e}")
+            return
+
+        if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        payload = body_gz if use_gzip else body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status, message):
+        body = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # stille; dashboards poller ofte
+
+
+def serve(host="0.0.0.0", port=8502, db_path=DB_PATH):
+    ApiHandler.cache = ResponseCache(db_path)
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    print(f"🌐 Aksjeradar-API på http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lesende JSON-API over aksjeradar.db")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--db", default=DB_PATH)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.db)
@@ -1,10 +1,23 @@
-import streamlit as st
-import pandas as pd
+import time
+_script_start = time.perf_counter()
+
+import json
 import sqlite3
-import yfinance as yf
+from datetime import datetime, timezone
+
+import streamlit as st
+
+from sectors import refresh_ticker_groups
+from snapshot import read_snapshot, write_snapshot
+
+# pandas og yfinance importeres først der de trengs (rask kaldstart)
 
 DB_PATH = "aksjeradar.db"
 PAGE_SIZE = 10
+COLDSTART_LOG = "coldstart.jsonl"
+LOAD_TTL = 600  # sekunder load_stock_data() ligger i cache
+CHART_DAYS = 252  # handelsdager i ettårsgrafen
+CHART_MIN_POINTS = 240  # færre kurser i matrisen -> graf fra yfinance
 
 def get_conn():
     conn = sqlite3.connect(DB_PATH, timeout=30)
@@ -18,7 +31,17 @@ def hide_ticker_in_app(ticker: str):
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("UPDATE stock_data SET hidden = 1 WHERE ticker = ?", (ticker,))
+    try:
+        # Skjulte tickere telles ikke i sektor-/bransjetallene
+        refresh_ticker_groups(conn, ticker)
+    except sqlite3.OperationalError:
+        pass  # sector/industry ikke migrert ennå (kjør updatedb.py)
     conn.commit()
+    try:
+        # Snapshotet vises ved neste kalde lasting; skjult ticker skal ikke være med
+        write_snapshot(conn)
+    except OSError:
+        pass
     conn.close()
 
 # -------------------------
@@ -30,33 +53,121 @@ if "confirm_delete" not in st.session_state:
 # -------------------------
 # Data
 # -------------------------
+TEXT_COLUMNS = ["ticker", "name", "sector", "industry"]
+LIST_COLUMNS = [
+    "ticker", "name", "sector", "industry", "price", "target", "targetLow", "targetHigh", "pb",
+    "mom_1d", "mom_1m", "mom_3m", "mom_1y",
+    "sma50_dist", "sma200_dist", "rsi_14", "vol_20d", "drawdown_52w", "avg_volume_20d",
+]
+FLOAT_COLUMNS = [c for c in LIST_COLUMNS if c not in TEXT_COLUMNS]
+
+def tradingview_url(ticker):
+    return f"https://www.tradingview.com/symbols/{ticker}/?timeframe=12M"
+
+@st.cache_resource
+def process_state():
+    # Felles for alle økter i prosessen: når ble load_stock_data() sist kjørt
+    # (dvs. når havnet data i cachen)? None = ingen data i cachen.
+    return {"loaded_at": None}
+
+def data_cached():
+    loaded_at = process_state()["loaded_at"]
+    return loaded_at is not None and time.monotonic() - loaded_at < LOAD_TTL
+
+def log_coldstart(**timings):
+    entry = {"ts": datetime.now(timezone.utc).isoformat(), **{k: round(v, 1) if v is not None else None for k, v in timings.items()}}
+    try:
+        with open(COLDSTART_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError:
+        pass
+    print(f"⏱️ Kaldstart: {entry}")
+
+@st.cache_resource(ttl=600)
+def price_matrix():
+    from pricematrix import open_matrix  # numpy trengs bare for detaljvisningen
+
+    return open_matrix()
+
+@st.cache_data(ttl=60)
+def search_stocks(query, include_hidden):
+    from search import search
+
+    conn = get_conn()
+    try:
+        return search(conn, query, limit=10, include_hidden=include_hidden)
+    finally:
+        conn.close()
+
 @st.cache_data(ttl=600)
+def load_sector_stats():
+    import pandas as pd
+
+    conn = get_conn()
+    try:
+        stats = pd.read_sql("SELECT * FROM sector_stats WHERE level = 'sector' ORDER BY name", conn)
+    except Exception:
+        stats = pd.DataFrame()  # ikke laget før første oppdatering
+    conn.close()
+    return stats.set_index("name") if not stats.empty else stats
+
+@st.cache_data(ttl=LOAD_TTL)
 def load_stock_data():
+    import pandas as pd
+
+    t0 = time.perf_counter()
     conn = get_conn()
-    df = pd.read_sql("SELECT * FROM stock_data WHERE hidden IS NULL OR hidden = 0", conn)
+    existing = {r[1] for r in conn.execute("PRAGMA table_info(stock_data)")}
+    cols = [c for c in LIST_COLUMNS if c in existing]
+    # Hent bare kolonnene listen bruker (ikke SELECT *)
+    df = pd.read_sql(
+        f"SELECT {', '.join(cols)} FROM stock_data "
+        "WHERE (hidden IS NULL OR hidden = 0) AND price IS NOT NULL",
+        conn,
+        dtype={c: "float32" for c in FLOAT_COLUMNS if c in cols},
+    )
     conn.close()
 
-    df = df[df["price"].notnull()].copy()
+    # Kompakte typer: kategori for tekst, float32 for tall
+    # (kolonner som mangler i en eldre database blir tomme)
+    df = df.reindex(columns=LIST_COLUMNS)
+    df[FLOAT_COLUMNS] = df[FLOAT_COLUMNS].astype("float32")
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].astype("category")
 
-    df["targetPercent"] = ((df["target"] - df["price"]) / df["price"]) * 100
+    df["targetPercent"] = ((df["target"] - df["price"]) / df["price"] * 100).astype("float32")
 
-    df["TradingView"] = df["ticker"].apply(
-        lambda t: f"https://www.tradingview.com/symbols/{t}/?timeframe=12M"
-    )
+    # Sektorrelativt: avstand til sektormedianen fra sector_stats
+    sector_stats = load_sector_stats()
+    sectors = df["sector"].astype(object)
+    for col, metric in [("targetPercent", "upside"), ("mom_3m", "mom_3m")]:
+        median = sector_stats[f"{metric}_median"] if not sector_stats.empty else {}
+        df[f"{col}_vs_sector"] = (df[col] - pd.to_numeric(sectors.map(median))).astype("float32")
 
-    df = df.drop(
-        columns=["pe", "debt_to_equity", "dividend_yield", "marketcap", "timestamp"],
-        errors="ignore"
-    )
+    num_cols = [c for c in df.columns if c not in TEXT_COLUMNS]
+    df[num_cols] = df[num_cols].round(2)
+
+    df = df.reset_index(drop=True)
+    stats = {
+        "rows": len(df),
+        "mem_mb": df.memory_usage(deep=True).sum() / 1e6,
+        "load_ms": (time.perf_counter() - t0) * 1000,
+    }
+    process_state()["loaded_at"] = time.monotonic()  # kjører bare ved cache-bom
+    return df, stats
 
-    for col in [
-        "price", "target", "targetLow", "targetHigh", "pb",
-        "mom_1d", "mom_1m", "mom_3m", "mom_1y", "targetPercent"
-    ]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").round(2)
+def fmt(v):
+    # float32 i rammen -> vis med to desimaler (ellers 16.549999237060547)
+    if v is None or v != v:
+        return "-"
+    return f"{v:.2f}"
 
-    return df.reset_index(drop=True)
+def heat_color(v):
+    if v is None or v != v:
+        return ""
+    alpha = min(abs(v) / 30, 1) * 0.6
+    rgb = "0,160,60" if v >= 0 else "200,30,30"
+    return f"background-color: rgba({rgb},{alpha:.2f})"
 
 # -------------------------
 # App setup
@@ -64,12 +175,78 @@ def load_stock_data():
 st.set_page_config(page_title="Aksjeradar", layout="wide")
 st.title("📊 Aksjeradar")
 
-df = load_stock_data()
+# Ingen data i cachen (ny prosess, utløpt ttl eller tømt etter skjuling):
+# vis forhåndsbygget første side mens full data lastes
+cold = not data_cached()
+first_paint_ms = None
+placeholder = st.empty()
+if cold:
+    snap = read_snapshot()
+    if snap and snap.get("rows"):
+        with placeholder.container():
+            st.caption(f"Laster data … viser topp {len(snap['rows'])} fra {snap['generated'][:16]}")
+            st.table(snap["rows"])
+        first_paint_ms = (time.perf_counter() - _script_start) * 1000
+
+t_load = time.perf_counter()
+df, load_stats = load_stock_data()
+lookup_ms = (time.perf_counter() - t_load) * 1000  # cache-treff: bare oppslaget
+placeholder.empty()
+st.caption(
+    f"{load_stats['rows']} aksjer · {load_stats['mem_mb']:.1f} MB i minnet · "
+    f"hentet på {lookup_ms:.0f} ms (første lasting fra databasen: {load_stats['load_ms']:.0f} ms)"
+)
+
+# -------------------------
+# Sektor-heatmap (fra sector_stats)
+# -------------------------
+sector_stats = load_sector_stats()
+if not sector_stats.empty:
+    with st.expander("🗺️ Sektorer"):
+        heat = sector_stats[[
+            "n", "mom_1d_median", "mom_1m_median", "mom_3m_median", "mom_1y_median",
+            "upside_median", "pb_median", "pe_median",
+        ]].rename(columns={
+            "n": "Antall", "mom_1d_median": "1D %", "mom_1m_median": "1M %",
+            "mom_3m_median": "3M %", "mom_1y_median": "1Y %", "upside_median": "Target %",
+            "pb_median": "P/B", "pe_median": "P/E",
+        })
+        st.dataframe(
+            heat.style.map(heat_color, subset=["1D %", "1M %", "3M %", "1Y %", "Target %"])
+                .format(precision=1),
+            use_container_width=True,
+        )
 
 if "page" not in st.session_state:
     st.session_state.page = 1
 if "selected_ticker" not in st.session_state:
     st.session_state.selected_ticker = None
+if "detail_from_search" not in st.session_state:
+    st.session_state.detail_from_search = False
+
+# -------------------------
+# Søk (FTS5-indeks fra updatedb.py)
+# -------------------------
+s1, s2 = st.columns([3, 1])
+with s1:
+    query = st.text_input("🔍 Søk etter ticker eller navn", placeholder="f.eks. NVDA eller alphabet")
+with s2:
+    include_hidden = st.toggle("Ta med skjulte", value=False)
+
+if query.strip():
+    hits = search_stocks(query, include_hidden)
+    if not hits:
+        st.caption("Ingen treff.")
+    for hit in hits:
+        h1, h2 = st.columns([1, 4])
+        label = hit["ticker"] + (" 🙈" if hit["hidden"] else "")
+        if h1.button(label, key=f"search_{hit['ticker']}"):
+            st.session_state.selected_ticker = hit["ticker"]
+            st.session_state.detail_from_search = True
+        h2.write(hit["name"] or "")
+
+# Detaljer for søketreff vises rett under søket
+search_detail_slot = st.container()
 
 # -------------------------
 # Sortering (global)
@@ -94,42 +271,56 @@ df_page = df.iloc[start:end]
 # Tabell
 # -------------------------
 st.markdown("### Aksjer")
-header = st.columns([2, 3, 1, 1, 1, 1, 1, 1])
+# Sorteres det på noe som ikke vises fra før (indikator, *_vs_sector, ...),
+# får sorteringsnøkkelen egen kolonne
+SHOWN_COLUMNS = ["ticker", "name", "price", "targetPercent", "mom_1m", "mom_1y"]
+extra = None if sort_by in SHOWN_COLUMNS else sort_by
+widths = [2, 3, 1, 1, 1, 1] + ([1] if extra else []) + [1, 1]
+header = st.columns(widths)
 header[0].markdown("**Ticker**")
 header[1].markdown("**Navn**")
 header[2].markdown("**Pris**")
 header[3].markdown("**Target %**")
 header[4].markdown("**1M %**")
 header[5].markdown("**1Y %**")
-header[6].markdown("**TV**")
-header[7].markdown("**🗑️**")
+if extra:
+    header[6].markdown(f"**{extra}**")
+header[-2].markdown("**TV**")
+header[-1].markdown("**🗑️**")
 
 for _, row in df_page.iterrows():
-    cols = st.columns([2, 3, 1, 1, 1, 1, 1, 1])
+    cols = st.columns(widths)
 
     # Klikkbar ticker = detaljer
     if cols[0].button(row["ticker"], key=f"sel_{row['ticker']}"):
         st.session_state.selected_ticker = row["ticker"]
+        st.session_state.detail_from_search = False
 
     cols[1].write(row.get("name", ""))
-    cols[2].write(row["price"])
-    cols[3].write(row["targetPercent"])
-    cols[4].write(row.get("mom_1m"))
-    cols[5].write(row.get("mom_1y"))
-    cols[6].link_button("📈", row["TradingView"])
-
+    cols[2].write(fmt(row["price"]))
+    cols[3].write(fmt(row["targetPercent"]))
+    cols[4].write(fmt(row.get("mom_1m")))
+    cols[5].write(fmt(row.get("mom_1y")))
+    if extra:
+        value = row.get(extra)
+        if extra in TEXT_COLUMNS:
+            cols[6].write(value if isinstance(value, str) else "-")
+        else:
+            cols[6].write(fmt(value))
     ticker = row["ticker"]
+    cols[-2].link_button("📈", tradingview_url(ticker))
 
     if st.session_state.confirm_delete == ticker:
-        if cols[7].button("❌ Bekreft", key=f"confirm_{ticker}"):
+        if cols[-1].button("❌ Bekreft", key=f"confirm_{ticker}"):
             hide_ticker_in_app(ticker)
             st.cache_data.clear()
+            process_state()["loaded_at"] = None
             st.session_state.confirm_delete = None
             if st.session_state.selected_ticker == ticker:
                 st.session_state.selected_ticker = None
             st.rerun()
     else:
-        if cols[7].button("🗑️", key=f"del_{ticker}"):
+        if cols[-1].button("🗑️", key=f"del_{ticker}"):
             st.session_state.confirm_delete = ticker
             st.rerun()
 
@@ -153,15 +344,23 @@ with p3:
             st.session_state.page += 1
             st.rerun()
 
+if cold:
+    log_coldstart(
+        first_paint_ms=first_paint_ms,
+        full_render_ms=(time.perf_counter() - _script_start) * 1000,
+        load_ms=load_stats["load_ms"],
+    )
+
 # -------------------------
 # Detaljer
 # -------------------------
-ticker = st.session_state.selected_ticker
-if ticker:
+def show_details(ticker):
     st.markdown("---")
     st.header(f"📈 {ticker}")
 
     try:
+        import yfinance as yf
+
         tk = yf.Ticker(ticker)
         info = tk.info
         c1, c2 = st.columns([1, 1])
@@ -176,9 +375,27 @@ if ticker:
             st.write(info.get("longBusinessSummary", ""))
 
         with c2:
-            hist = tk.history(period="1y")
-            if not hist.empty:
-                st.line_chart(hist["Close"])
+            # Ettårsgraf rett fra kursmatrisen (memmap); yfinance bare som reserve
+            import pandas as pd
+
+            pm = price_matrix()
+            col = pm.column(ticker, last=CHART_DAYS) if pm is not None else None
+            closes = (
+                pd.Series(col, index=pd.to_datetime(pm.dates[-len(col):]), name="Close").dropna()
+                if col is not None else pd.Series(dtype="float32")
+            )
+            # Ny ticker har bare noen få dager i matrisen -> hent hele året fra yfinance
+            if len(closes) >= CHART_MIN_POINTS:
+                st.line_chart(closes)
+            else:
+                hist = tk.history(period="1y")
+                if not hist.empty:
+                    st.line_chart(hist["Close"])
 
     except Exception as e:
         st.error(f"Kunne ikke hente data for {ticker}: {e}")
+
+ticker = st.session_state.selected_ticker
+if ticker:
+    with search_detail_slot if st.session_state.detail_from_search else st.container():
+        show_details(ticker)
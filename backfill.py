@@ -0,0 +1,180 @@
+import argparse
+import time
+import sqlite3
+import yfinance as yf
+import pandas as pd
+from datetime import datetime, timezone
+
+from history import ensure_history_table, bars_from_frame, write_bars
+from indicators import invalidate
+from pricematrix import open_matrix, rebuild_from_history
+from updatedb import get_conn, get_existing_tickers
+
+# Full historikk for nye databaser / nye tickere.
+#   python backfill.py                 -> alle tickere i stock_data
+#   python backfill.py AAPL MSFT       -> bare disse
+#   python backfill.py --pause 5       -> strup for å kjøre ved siden av updatedb.py
+# Avbrutt kjøring fortsetter der den slapp (sjekkpunkt per batch i backfill_progress).
+
+CHUNK_SIZE = 50
+BUSY_RETRIES = 20   # forsøk per batch når updatedb.py holder skrivelåsen
+BUSY_PAUSE = 5.0    # minste ventetid mellom forsøkene (sekunder)
+
+
+def ensure_backfill_tables(conn: sqlite3.Connection):
+    ensure_history_table(conn)
+    conn.execute("""CREATE TABLE IF NOT EXISTS backfill_progress (
+        ticker TEXT PRIMARY KEY,
+        status TEXT,          -- 'done', 'empty' eller 'failed'
+        rows INTEGER,
+        first_date TEXT,
+        last_date TEXT,
+        finished TEXT
+    )""")
+    conn.commit()
+
+
+def pending_tickers(conn, tickers, retry_failed=False):
+    """Tickere som ikke er ferdig backfillet (sjekkpunkt-tabellen avgjør).
+    --retry-failed prøver både 'failed' og 'empty' på nytt."""
+    skip = ("done",) if retry_failed else ("done", "empty", "failed")
+    done = {r[0] for r in conn.execute(
+        f"SELECT ticker FROM backfill_progress WHERE status IN ({','.join('?' * len(skip))})", skip
+    )}
+    return [t for t in tickers if t not in done]
+
+
+def _frame_for(data, ticker):
+    if data is None or data.empty:
+        return None
+    if isinstance(data.columns, pd.MultiIndex):
+        if ticker not in data.columns.get_level_values(0):
+            return None
+        data = data[ticker]
+    return data.dropna(how="all")
+
+
+def matrix_stale(conn):
+    """Mangler kursmatrisen, eller er den bygget før siste ferdige backfill?
+    (En avbrutt kjøring kan ha lagret alle batcher uten å bygge matrisen.)"""
+    last = conn.execute("SELECT MAX(finished) FROM backfill_progress WHERE status = 'done'").fetchone()[0]
+    if last is None:
+        return False
+    pm = open_matrix()
+    return pm is None or pm.rebuilt is None or pm.rebuilt < last
+
+
+def _is_busy(e):
+    msg = str(e).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def download_errors():
+    # yf.download kaster ikke ved struping/feil per ticker, men gir tomme (NaN)
+    # kolonner og legger feilen i yfinance.shared._ERRORS
+    shared = getattr(yf, "shared", None)
+    return dict(getattr(shared, "_ERRORS", None) or {})
+
+
+def download_chunk(chunk):
+    # Én batch-forespørsel for hele chunken i stedet for én per ticker
+    return yf.download(
+        chunk,
+        period="max",
+        interval="1d",
+        group_by="ticker",
+        auto_adjust=True,
+        threads=True,
+        progress=False,
+    )
+
+
+def backfill(tickers, chunk_size=CHUNK_SIZE, pause=0.0, retry_failed=False, restart=False):
+    conn = get_conn()
+    ensure_backfill_tables(conn)
+    if restart:
+        conn.execute("DELETE FROM backfill_progress")
+        conn.commit()
+
+    todo = pending_tickers(conn, list(dict.fromkeys(tickers)), retry_failed)
+    print(f"📦 Backfill: {len(todo)} av {len(tickers)} tickere gjenstår.")
+    written = 0
+
+    for i in range(0, len(todo), chunk_size):
+        chunk = todo[i:i + chunk_size]
+        try:
+            data = download_chunk(chunk)
+        except Exception as e:
+            print(f"⚠️ Nedlasting feilet for batch {chunk[0]}..{chunk[-1]}: {e}")
+            data = None
+        errors = download_errors()
+
+        finished = datetime.now(timezone.utc).isoformat()
+        progress = []
+        rows_by_ticker = {}
+        for t in chunk:
+            rows = bars_from_frame(t, _frame_for(data, t))
+            rows_by_ticker[t] = rows
+            if data is None or (not rows and t in errors):
+                progress.append((t, "failed", 0, None, None, finished))
+            elif not rows:
+                progress.append((t, "empty", 0, None, None, finished))
+            else:
+                progress.append((t, "done", len(rows), rows[0][1], rows[-1][1], finished))
+
+        # Én stor transaksjon per batch: kursrader + sjekkpunkt skrives samlet,
+        # så en avbrutt batch blir enten helt med eller kjøres på nytt.
+        # Holder updatedb.py skrivelåsen, ventes det og prøves igjen.
+        for attempt in range(1, BUSY_RETRIES + 1):
+            try:
+                total = 0
+                with conn:
+                    for t, rows in rows_by_ticker.items():
+                        total += write_bars(conn, rows)
+                    # Ny historikk -> indikatorene regnes helt om ved neste oppdatering
+                    invalidate(conn, [t for t, rows in rows_by_ticker.items() if rows])
+                    conn.executemany("""
+                        INSERT OR REPLACE INTO backfill_progress
+                        (ticker, status, rows, first_date, last_date, finished)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, progress)
+                break
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == BUSY_RETRIES:
+                    raise
+                print(f"⏳ Databasen er låst ({e}); prøver batchen igjen ({attempt}/{BUSY_RETRIES}).")
+                time.sleep(max(pause, BUSY_PAUSE))
+
+        written += total
+        done = min(i + chunk_size, len(todo))
+        print(f"✅ Batch {done}/{len(todo)}: {total} kursrader lagret.")
+
+        if pause and done < len(todo):
+            time.sleep(pause)
+
+    # Ny historikk -> bygg kursmatrisen på nytt (låst mot samtidig updatedb.py);
+    # også når en tidligere kjøring ble avbrutt før den kom hit
+    if written or matrix_stale(conn):
+        shape = rebuild_from_history(conn)
+        print(f"✅ Kursmatrise bygget: {shape[0]} dager × {shape[1]} tickere.")
+
+    conn.close()
+    print("✅ Backfill ferdig.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Last inn full daglig historikk til price_history.")
+    parser.add_argument("tickers", nargs="*", help="Tickere (standard: alle i stock_data)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Tickere per batch-forespørsel")
+    parser.add_argument("--pause", type=float, default=0.0, help="Sekunder å vente mellom batcher")
+    parser.add_argument("--retry-failed", action="store_true", help="Prøv feilede tickere på nytt")
+    parser.add_argument("--restart", action="store_true", help="Glem sjekkpunkter og start på nytt")
+    args = parser.parse_args()
+
+    backfill(
+        args.tickers or get_existing_tickers(),
+        chunk_size=args.chunk_size,
+        pause=args.pause,
+        retry_failed=args.retry_failed,
+        restart=args.restart,
+    )
@@ -0,0 +1,109 @@
+import json
+import sqlite3
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# -------------------------
+# Handelskalendere per børs
+# -------------------------
+# Helligdager ligger lokalt i holidays.json (én liste per børs). For år som ikke
+# finnes i lista regnes alle hverdager som handelsdager (trygt: hellere én
+# unødvendig henting enn en glemt).
+
+HOLIDAYS_PATH = "holidays.json"
+
+EXCHANGES = {
+    "US": ("America/New_York", time(9, 30), time(16, 0)),
+    "TSX": ("America/Toronto", time(9, 30), time(16, 0)),
+    "LSE": ("Europe/London", time(8, 0), time(16, 30)),
+    "OSE": ("Europe/Oslo", time(9, 0), time(16, 20)),
+}
+
+# Yahoo-suffiks -> børs (uten suffiks = US)
+SUFFIXES = {
+    ".TO": "TSX",
+    ".V": "TSX",
+    ".L": "LSE",
+    ".OL": "OSE",
+}
+
+MAX_SCAN_DAYS = 14  # lengre opphold enn dette -> hent uansett
+
+_holidays = None
+
+
+def holidays():
+    global _holidays
+    if _holidays is None:
+        try:
+            with open(HOLIDAYS_PATH, encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            raw = {}
+        _holidays = {ex: {date.fromisoformat(d) for d in days} for ex, days in raw.items()}
+    return _holidays
+
+
+def exchange_for(ticker):
+    for suffix, exchange in SUFFIXES.items():
+        if ticker.upper().endswith(suffix):
+            return exchange
+    return "US"
+
+
+def is_trading_day(exchange, day):
+    if day.weekday() >= 5:
+        return False
+    return day not in holidays().get(exchange, ())
+
+
+def _session(exchange, day):
+    tz, open_t, close_t = EXCHANGES[exchange]
+    zone = ZoneInfo(tz)
+    return (
+        datetime.combine(day, open_t, tzinfo=zone).astimezone(timezone.utc),
+        datetime.combine(day, close_t, tzinfo=zone).astimezone(timezone.utc),
+    )
+
+
+def traded_between(exchange, since, now):
+    """True hvis børsen hadde åpent på noe tidspunkt i (since, now]."""
+    if since is None or now - since > timedelta(days=MAX_SCAN_DAYS):
+        return True
+    zone = ZoneInfo(EXCHANGES[exchange][0])
+    day = since.astimezone(zone).date()
+    last = now.astimezone(zone).date()
+    while day <= last:
+        if is_trading_day(exchange, day):
+            opens, closes = _session(exchange, day)
+            if opens < now and closes > since:
+                return True
+        day += timedelta(days=1)
+    return False
+
+
+def needs_refresh(ticker, last_fetch, now):
+    """Kan tickeren ha nye data siden forrige henting?"""
+    return traded_between(exchange_for(ticker), last_fetch, now)
+
+
+# -------------------------
+# Sist hentet per ticker
+# -------------------------
+def ensure_refresh_table(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS ticker_refresh (
+        ticker TEXT PRIMARY KEY,
+        last_fetch TEXT          -- ISO-tid (UTC) for siste vellykkede henting
+    )""")
+
+
+def load_last_fetch(conn: sqlite3.Connection):
+    ensure_refresh_table(conn)
+    return {t: datetime.fromisoformat(ts) for t, ts in conn.execute("SELECT ticker, last_fetch FROM ticker_refresh")}
+
+
+def save_last_fetch(conn: sqlite3.Connection, tickers, when):
+    conn.executemany(
+        "INSERT OR REPLACE INTO ticker_refresh (ticker, last_fetch) VALUES (?, ?)",
+        [(t, when.isoformat()) for t in tickers],
+    )
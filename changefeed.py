@@ -0,0 +1,107 @@
+import math
+import sqlite3
+from datetime import datetime, timezone
+
+# -------------------------
+# Endringslogg per oppdateringskjøring
+# -------------------------
+KEEP_RUNS = 200  # eldre kjøringer slettes fra change_log
+
+
+def ensure_changefeed_tables(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS update_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started TEXT,
+        finished TEXT,
+        tickers INTEGER,
+        changed INTEGER,
+        unchanged INTEGER
+    )""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS change_log (
+        run_id INTEGER NOT NULL,
+        ticker TEXT NOT NULL,
+        field TEXT NOT NULL,
+        old_value,
+        new_value,
+        delta REAL,   -- new - old (bare tall)
+        pct REAL,     -- endring i prosent av old (bare tall, old != 0)
+        PRIMARY KEY (run_id, ticker, field)
+    ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS change_log_ticker ON change_log (ticker, run_id)")
+    # Største kursbevegelser siden forrige kjøring
+    conn.execute("""CREATE VIEW IF NOT EXISTS latest_movers AS
+        SELECT c.ticker, s.name, c.old_value, c.new_value, c.delta, c.pct
+        FROM change_log c LEFT JOIN stock_data s ON s.ticker = c.ticker
+        WHERE c.field = 'price'
+          AND c.pct IS NOT NULL
+          AND c.run_id = (SELECT MAX(run_id) FROM change_log)
+        ORDER BY ABS(c.pct) DESC""")
+
+
+def start_run(conn: sqlite3.Connection, started):
+    ensure_changefeed_tables(conn)
+    # Samme format som finished (ISO 8601 med "T")
+    cur = conn.execute("INSERT INTO update_runs (started) VALUES (?)", (started.isoformat(),))
+    return cur.lastrowid
+
+
+def finish_run(conn: sqlite3.Connection, run_id, tickers, changed):
+    conn.execute(
+        "UPDATE update_runs SET finished = ?, tickers = ?, changed = ?, unchanged = ? WHERE run_id = ?",
+        (datetime.now(timezone.utc).isoformat(), tickers, changed, tickers - changed, run_id),
+    )
+    conn.execute("DELETE FROM change_log WHERE run_id <= ?", (run_id - KEEP_RUNS,))
+
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        if math.isnan(a) or math.isnan(b):
+            return math.isnan(a) and math.isnan(b)
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+    return a == b
+
+
+def diff_row(old, new):
+    """Returnerer {felt: (gammel, ny)} for feltene som faktisk endret seg.
+    old=None betyr ny ticker: alle felt med verdi regnes som endret."""
+    if old is None:
+        return {f: (None, v) for f, v in new.items() if v is not None}
+    return {f: (old.get(f), v) for f, v in new.items() if not _same(old.get(f), v)}
+
+
+def record_changes(conn: sqlite3.Connection, run_id, ticker, changes):
+    rows = []
+    for field, (old, new) in changes.items():
+        delta = pct = None
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+            delta = new - old
+            if old:
+                pct = delta / abs(old) * 100
+        rows.append((run_id, ticker, field, old, new, delta, pct))
+    conn.executemany("""
+        INSERT OR REPLACE INTO change_log (run_id, ticker, field, old_value, new_value, delta, pct)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+
+def changed_tickers(conn: sqlite3.Connection, run_id, fields=None):
+    """Tickere som endret seg i kjøringen (evt. bare for gitte felt)."""
+    sql = "SELECT DISTINCT ticker FROM change_log WHERE run_id = ?"
+    params = [run_id]
+    if fields:
+        sql += f" AND field IN ({','.join('?' * len(fields))})"
+        params += list(fields)
+    return [r[0] for r in conn.execute(sql, params)]
+
+
+def biggest_movers(conn: sqlite3.Connection, field="price", limit=20, run_id=None):
+    """Største endringer i et felt siden forrige kjøring (standard: siste kjøring)."""
+    if run_id is None:
+        run_id = conn.execute("SELECT MAX(run_id) FROM change_log").fetchone()[0]
+    return conn.execute("""
+        SELECT ticker, old_value, new_value, delta, pct FROM change_log
+        WHERE run_id = ? AND field = ? AND pct IS NOT NULL
+        ORDER BY ABS(pct) DESC LIMIT ?
+    """, (run_id, field, limit)).fetchall()
@@ -0,0 +1,68 @@
+import sqlite3
+
+# -------------------------
+# Daglig kurshistorikk (én rad per ticker og handelsdag)
+# -------------------------
+HISTORY_COLUMNS = ("ticker", "date", "open", "high", "low", "close", "volume")
+
+
+def ensure_history_table(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS price_history (
+        ticker TEXT NOT NULL,
+        date TEXT NOT NULL,      -- YYYY-MM-DD (børsens lokale dato)
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume REAL,
+        PRIMARY KEY (ticker, date)
+    ) WITHOUT ROWID""")
+
+
+def _num(v):
+    # NaN fra pandas lagres som NULL
+    if v is None or v != v:
+        return None
+    return float(v)
+
+
+def bars_from_frame(ticker, hist):
+    """Gjør om en yfinance-historikk (DataFrame med DatetimeIndex) til rader for price_history."""
+    if hist is None or hist.empty:
+        return []
+    cols = {c: hist[c].tolist() if c in hist.columns else [None] * len(hist)
+            for c in ("Open", "High", "Low", "Close", "Volume")}
+    dates = [d.strftime("%Y-%m-%d") for d in hist.index]
+    rows = []
+    for i, d in enumerate(dates):
+        close = _num(cols["Close"][i])
+        if close is None:
+            continue  # hopp over dager uten sluttkurs
+        rows.append((
+            ticker, d,
+            _num(cols["Open"][i]), _num(cols["High"][i]), _num(cols["Low"][i]),
+            close, _num(cols["Volume"][i]),
+        ))
+    return rows
+
+
+def write_bars(conn: sqlite3.Connection, rows):
+    """Skriver kursrader (upsert). Commit styres av kalleren."""
+    conn.executemany("""
+        INSERT INTO price_history (ticker, date, open, high, low, close, volume)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(ticker, date) DO UPDATE SET
+            open=excluded.open,
+            high=excluded.high,
+            low=excluded.low,
+            close=excluded.close,
+            volume=excluded.volume
+    """, rows)
+    return len(rows)
+
+
+def last_bar_dates(conn: sqlite3.Connection):
+    """Returnerer {ticker: siste lagrede dato}."""
+    ensure_history_table(conn)
+    rows = conn.execute("SELECT ticker, MAX(date) FROM price_history GROUP BY ticker").fetchall()
+    return dict(rows)
@@ -0,0 +1,265 @@
+import copy
+import json
+import math
+import sqlite3
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from history import ensure_history_table, write_bars
+
+# -------------------------
+# Tekniske indikatorer med rullerende tilstand per ticker
+# -------------------------
+# Tilstanden (løpende summer, Wilder-snitt, siste 252 sluttkurser osv.) lagres i
+# indicator_state, så hver nye dag oppdateres i O(1). Full (vektorisert) omregning
+# fra price_history skjer bare når tilstand mangler (ny ticker / etter backfill),
+# ved hull i dataene eller når justert historikk har endret seg (splitt).
+
+INDICATOR_COLUMNS = ["sma50_dist", "sma200_dist", "rsi_14", "vol_20d", "drawdown_52w", "avg_volume_20d"]
+
+RSI_N = 14
+VOL_N = 20
+HIGH_N = 252
+SPLIT_TOLERANCE = 0.02  # større avvik i siste lagrede sluttkurs = ny justert historikk
+
+
+def ensure_indicator_table(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS indicator_state (
+        ticker TEXT PRIMARY KEY,
+        last_date TEXT,
+        state TEXT            -- JSON med rullerende tilstand
+    )""")
+
+
+def invalidate(conn: sqlite3.Connection, tickers):
+    """Tving full omregning neste gang (brukes etter backfill)."""
+    ensure_indicator_table(conn)
+    conn.executemany("DELETE FROM indicator_state WHERE ticker = ?", [(t,) for t in tickers])
+
+
+# -------------------------
+# Inkrementell oppdatering (O(1) per ny dag)
+# -------------------------
+def _empty_state():
+    return {
+        "i": 0, "last_close": None,
+        "closes": deque(maxlen=HIGH_N), "sum50": 0.0, "sum200": 0.0,
+        "rets": deque(maxlen=VOL_N), "sum_r": 0.0, "sum_r2": 0.0,
+        "vols": deque(maxlen=VOL_N), "sum_v": 0.0,
+        "rsi_n": 0, "avg_gain": 0.0, "avg_loss": 0.0,
+        "maxq": deque(),  # [indeks, kurs] synkende – maks over siste HIGH_N dager
+    }
+
+
+def push_bar(s, close, volume):
+    closes = s["closes"]
+    # Løpende summer for SMA 50/200 (verdien som faller ut ligger fortsatt i closes)
+    if len(closes) >= 50:
+        s["sum50"] -= closes[-50]
+    if len(closes) >= 200:
+        s["sum200"] -= closes[-200]
+    s["sum50"] += close
+    s["sum200"] += close
+    closes.append(close)
+
+    prev = s["last_close"]
+    if prev is not None:
+        change = close - prev
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if s["rsi_n"] < RSI_N:
+            # Wilder: første snitt er et vanlig gjennomsnitt av de 14 første endringene
+            s["avg_gain"] += gain / RSI_N
+            s["avg_loss"] += loss / RSI_N
+            s["rsi_n"] += 1
+        else:
+            s["avg_gain"] = (s["avg_gain"] * (RSI_N - 1) + gain) / RSI_N
+            s["avg_loss"] = (s["avg_loss"] * (RSI_N - 1) + loss) / RSI_N
+
+        if prev > 0 and close > 0:
+            r = math.log(close / prev)
+            rets = s["rets"]
+            if len(rets) == VOL_N:
+                s["sum_r"] -= rets[0]
+                s["sum_r2"] -= rets[0] ** 2
+            rets.append(r)
+            s["sum_r"] += r
+            s["sum_r2"] += r * r
+
+    vols = s["vols"]
+    volume = volume or 0.0
+    if len(vols) == VOL_N:
+        s["sum_v"] -= vols[0]
+    vols.append(volume)
+    s["sum_v"] += volume
+
+    maxq = s["maxq"]
+    while maxq and maxq[-1][1] <= close:
+        maxq.pop()
+    maxq.append([s["i"], close])
+    while maxq[0][0] <= s["i"] - HIGH_N:
+        maxq.popleft()
+
+    s["last_close"] = close
+    s["i"] += 1
+
+
+def values(s):
+    closes = s["closes"]
+    if not closes:
+        return dict.fromkeys(INDICATOR_COLUMNS)
+    close = closes[-1]
+    out = dict.fromkeys(INDICATOR_COLUMNS)
+    if len(closes) >= 50:
+        out["sma50_dist"] = (close / (s["sum50"] / 50) - 1) * 100
+    if len(closes) >= 200:
+        out["sma200_dist"] = (close / (s["sum200"] / 200) - 1) * 100
+    if s["rsi_n"] >= RSI_N:
+        out["rsi_14"] = 100.0 if s["avg_loss"] == 0 else 100 - 100 / (1 + s["avg_gain"] / s["avg_loss"])
+    n = len(s["rets"])
+    if n == VOL_N:
+        var = max((s["sum_r2"] - s["sum_r"] ** 2 / n) / (n - 1), 0.0)
+        out["vol_20d"] = math.sqrt(var) * math.sqrt(252) * 100
+    if s["maxq"]:
+        out["drawdown_52w"] = (close / s["maxq"][0][1] - 1) * 100
+    if len(s["vols"]) == VOL_N:
+        out["avg_volume_20d"] = s["sum_v"] / VOL_N
+    return out
+
+
+def _dump(s):
+    return json.dumps({k: list(v) if isinstance(v, deque) else v for k, v in s.items()})
+
+
+def _load(text):
+    s = _empty_state()
+    for k, v in json.loads(text).items():
+        if isinstance(s.get(k), deque):
+            s[k].extend(v)
+        else:
+            s[k] = v
+    return s
+
+
+# -------------------------
+# Full omregning (vektorisert)
+# -------------------------
+def full_state(close: pd.Series, volume: pd.Series):
+    """Bygger tilstanden fra hele historikken med vektoriserte pandas-operasjoner."""
+    close = close.astype(float).reset_index(drop=True)
+    volume = volume.fillna(0.0).astype(float).reset_index(drop=True)
+    s = _empty_state()
+    n = len(close)
+    if n == 0:
+        return s
+
+    tail = close.iloc[-HIGH_N:]
+    s["closes"].extend(tail.tolist())
+    s["sum50"] = float(close.iloc[-50:].sum())
+    s["sum200"] = float(close.iloc[-200:].sum())
+
+    delta = close.diff().iloc[1:]
+    gain, loss = delta.clip(lower=0), (-delta).clip(lower=0)
+    s["rsi_n"] = min(len(delta), RSI_N)
+    if len(delta) < RSI_N:
+        s["avg_gain"] = float(gain.sum() / RSI_N)
+        s["avg_loss"] = float(loss.sum() / RSI_N)
+    else:
+        # Wilder = EMA med alpha 1/14, startet fra snittet av de 14 første endringene
+        def wilder(x):
+            seeded = pd.concat([pd.Series([x.iloc[:RSI_N].mean()]), x.iloc[RSI_N:]])
+            return float(seeded.ewm(alpha=1 / RSI_N, adjust=False).mean().iloc[-1])
+        s["avg_gain"] = wilder(gain)
+        s["avg_loss"] = wilder(loss)
+
+    valid = (close > 0) & (close.shift() > 0)
+    rets = np.log(close / close.shift())[valid].iloc[-VOL_N:]
+    s["rets"].extend(rets.tolist())
+    s["sum_r"] = float(rets.sum())
+    s["sum_r2"] = float((rets ** 2).sum())
+
+    vols = volume.iloc[-VOL_N:]
+    s["vols"].extend(vols.tolist())
+    s["sum_v"] = float(vols.sum())
+
+    # Monoton kø over siste HIGH_N kurser (samme som push_bar ville bygget)
+    offset = n - len(tail)
+    for j, c in enumerate(tail.tolist()):
+        while s["maxq"] and s["maxq"][-1][1] <= c:
+            s["maxq"].pop()
+        s["maxq"].append([offset + j, c])
+
+    s["i"] = n
+    s["last_close"] = float(close.iloc[-1])
+    return s
+
+
+def _recompute_from_history(conn, ticker, before):
+    hist = pd.read_sql(
+        "SELECT close, volume FROM price_history WHERE ticker = ? AND date < ? ORDER BY date",
+        conn, params=(ticker, before),
+    )
+    return full_state(hist["close"], hist["volume"])
+
+
+# -------------------------
+# Inngang fra updatedb.py
+# -------------------------
+def update_indicators(conn: sqlite3.Connection, ticker, bars):
+    """bars: rader fra history.bars_from_frame (stigende dato). Lagrer nye dager i
+    price_history, oppdaterer tilstanden og returnerer (indikatorverdier, full), der
+    full=True betyr at historikken ble regnet om helt (ny ticker, hull eller splitt).
+
+    Siste dag kan være uferdig (børsen er åpen), så den lagres ikke i tilstanden:
+    tilstanden gjelder til og med nest siste dag, og siste dag legges på en kopi."""
+    ensure_history_table(conn)
+    ensure_indicator_table(conn)
+    if not bars:
+        return dict.fromkeys(INDICATOR_COLUMNS), False
+
+    row = conn.execute(
+        "SELECT last_date, state FROM indicator_state WHERE ticker = ?", (ticker,)
+    ).fetchone()
+    s = _load(row[1]) if row else None
+    last_date = row[0] if row else None
+    dates = [b[1] for b in bars]
+
+    full = s is None
+    if not full and last_date is not None:
+        if last_date < dates[0]:
+            full = True  # hull: mangler dager mellom lagret tilstand og hentet historikk
+        elif last_date in dates:
+            fetched = bars[dates.index(last_date)][5]
+            if s["last_close"] and abs(fetched / s["last_close"] - 1) > SPLIT_TOLERANCE:
+                full = True  # justert historikk endret (splitt o.l.)
+                _drop_unadjusted(conn, ticker, dates[0])
+
+    if full:
+        write_bars(conn, bars)
+        s = _recompute_from_history(conn, ticker, before=dates[-1])
+        committed = dates[-2] if len(dates) > 1 else None
+    else:
+        new = [b for b in bars if last_date is None or b[1] > last_date]
+        write_bars(conn, new)
+        for b in new[:-1]:
+            push_bar(s, b[5], b[6])
+        committed = new[-2][1] if len(new) > 1 else last_date
+
+    conn.execute(
+        "INSERT OR REPLACE INTO indicator_state (ticker, last_date, state) VALUES (?, ?, ?)",
+        (ticker, committed, _dump(s)),
+    )
+
+    current = copy.deepcopy(s)
+    if committed is None or dates[-1] > committed:
+        push_bar(current, bars[-1][5], bars[-1][6])
+    return values(current), full
+
+
+def _drop_unadjusted(conn, ticker, first_fetched):
+    # Eldre lagrede kurser er ujustert – fjern dem og la backfill hente dem på nytt
+    conn.execute("DELETE FROM price_history WHERE ticker = ? AND date < ?", (ticker, first_fetched))
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'backfill_progress'").fetchone():
+        conn.execute("DELETE FROM backfill_progress WHERE ticker = ?", (ticker,))
+    print(f"✂️ {ticker}: justert historikk endret, full omregning (kjør backfill på nytt).")
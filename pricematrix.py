@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: ingen flock, én skriver om gangen må sikres manuelt
+    fcntl = None
+
+import numpy as np
+
+# -------------------------
+# Minnemappet sluttkursmatrise (dato × ticker, float32)
+# -------------------------
+# prices/close.<n>.f32 – rå float32, radvis: én rad per handelsdag, `capacity` kolonner
+# prices/meta.json     – {"capacity": C, "tickers": [...], "dates": [...],
+#                         "data": "close.<n>.f32", "rebuilt": ISO-tid}
+#
+# Oppdateringen legger til én rad per ny dag (append), og leserne mapper filen og
+# slicer direkte med NumPy (ingen parsing eller kopiering). Data skrives alltid før
+# meta.json, så en leser ser aldri rader som ikke er ferdig skrevet. Når filen må
+# skrives på nytt (ny kapasitet, innsatte datoer, rebuild) blir det en ny generasjon
+# <n>; meta.json peker på den, så en leser aldri blander gammel meta og ny layout.
+
+PRICE_DIR = "prices"
+DATA_FILE = "close.f32"  # eldre matriser uten "data" i meta.json
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+MIN_CAPACITY = 1024
+DTYPE = np.float32
+
+
+class PriceMatrix:
+    def __init__(self, directory=PRICE_DIR, mode="r"):
+        self.directory = directory
+        self.mode = mode
+        self.meta_path = os.path.join(directory, META_FILE)
+        with open(self.meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.data_file = meta.get("data", DATA_FILE)
+        self.data_path = os.path.join(directory, self.data_file)
+        self.capacity = meta["capacity"]
+        self.tickers = meta["tickers"]
+        self.dates = meta["dates"]
+        self.rebuilt = meta.get("rebuilt")  # sist bygget helt fra price_history
+        self.ticker_index = {t: i for i, t in enumerate(self.tickers)}
+        self.date_index = {d: i for i, d in enumerate(self.dates)}
+        self._map = None
+
+    # ---- lesing ----
+    @property
+    def raw(self):
+        """Hele matrisen som memmap (dato × capacity)."""
+        if self._map is None:
+            if not self.dates:
+                return np.empty((0, self.capacity), dtype=DTYPE)
+            self._map = np.memmap(
+                self.data_path, dtype=DTYPE, mode="r" if self.mode == "r" else "r+",
+                shape=(len(self.dates), self.capacity),
+            )
+        return self._map
+
+    @property
+    def closes(self):
+        """Visning (ingen kopi) av kolonnene som er i bruk."""
+        return self.raw[:, :len(self.tickers)]
+
+    def column(self, ticker, last=None):
+        """Sluttkurser for én ticker som visning; None hvis ukjent."""
+        j = self.ticker_index.get(ticker)
+        if j is None:
+            return None
+        col = self.raw[:, j]
+        return col[-last:] if last else col
+
+    def filled(self):
+        """Antall dager med kurs per ticker."""
+        counts = np.count_nonzero(~np.isnan(self.closes), axis=0)
+        return dict(zip(self.tickers, counts.tolist()))
+
+    def close(self):
+        self._map = None
+
+
+def open_matrix(directory=PRICE_DIR):
+    """Åpner matrisen for lesing, eller None hvis den ikke er bygget ennå."""
+    try:
+        return PriceMatrix(directory)
+    except (OSError, ValueError):
+        return None
+
+
+# -------------------------
+# Skriving (updatedb.py, backfill.py og CLI)
+# -------------------------
+@contextmanager
+def _locked(directory):
+    """Eksklusiv lås på prices/ så to skrivere (updatedb og backfill) ikke
+    leser/skriver filen samtidig. Leserne trenger ingen lås."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_meta(directory, capacity, tickers, dates, data, rebuilt=None):
+    path = os.path.join(directory, META_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"capacity": capacity, "tickers": tickers, "dates": dates,
+                   "data": data, "rebuilt": rebuilt}, f)
+    os.replace(tmp, path)
+
+
+def _create(directory, capacity, tickers, dates, matrix, rebuilt=None):
+    os.makedirs(directory, exist_ok=True)
+    current = open_matrix(directory)
+    previous = current.data_file if current is not None else None
+    generation = 1
+    if previous and previous != DATA_FILE:
+        generation = int(previous.split(".")[1]) + 1
+    data = f"close.{generation}.f32"
+
+    full = np.full((len(dates), capacity), np.nan, dtype=DTYPE)
+    full[:, :matrix.shape[1]] = matrix
+    full.tofile(os.path.join(directory, data))
+    _write_meta(directory, capacity, tickers, dates, data, rebuilt)
+
+    # Forrige generasjon beholdes: en leser kan ha lest meta.json rett før byttet
+    for name in os.listdir(directory):
+        if name.startswith("close.") and name.endswith(".f32") and name not in (data, previous):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass  # Windows: fortsatt mappet av en leser; ryddes neste gang
+
+
+def _capacity_for(n):
+    cap = MIN_CAPACITY
+    while cap < n:
+        cap *= 2
+    return cap
+
+
+def write_closes(entries, directory=PRICE_DIR, reset=()):
+    """entries: [(ticker, dato, sluttkurs)]. Nye datoer etter siste rad legges til
+    som nye rader; kjente datoer overskrives på plass. Manglende datoer før/midt i
+    kalenderen (ny ticker sådd med full historikk) gir én omskriving av filen.
+    reset: tickere hvis kolonne tømmes først (justert historikk endret, f.eks. splitt)."""
+    if not entries:
+        return 0
+    with _locked(directory):
+        return _write_closes(entries, directory, set(reset))
+
+
+def _write_closes(entries, directory, reset):
+    pm = open_matrix(directory)
+    if pm is None:
+        tickers = sorted({t for t, _, _ in entries})
+        _create(directory, _capacity_for(len(tickers)), tickers, [], np.empty((0, len(tickers)), dtype=DTYPE))
+        pm = PriceMatrix(directory)
+
+    tickers, dates, capacity = list(pm.tickers), list(pm.dates), pm.capacity
+    ticker_index = dict(pm.ticker_index)
+    for t, _, _ in entries:
+        if t not in ticker_index:
+            ticker_index[t] = len(tickers)
+            tickers.append(t)
+
+    known = set(dates)
+    inserted = {d for _, d, _ in entries if d not in known and dates and d < dates[-1]}
+    if len(tickers) > capacity or inserted:
+        # Tom for kolonner (dobbel kapasitet) eller datoer som må settes inn
+        # før siste rad: skriv filen på nytt med gamle rader på nye plasser
+        old = np.array(pm.closes)
+        pm.close()
+        capacity = max(capacity, _capacity_for(len(tickers)))
+        merged = sorted(known | inserted)
+        pos = {d: i for i, d in enumerate(merged)}
+        moved = np.full((len(merged), old.shape[1]), np.nan, dtype=DTYPE)
+        moved[[pos[d] for d in dates]] = old
+        _create(directory, capacity, tickers, merged, moved, pm.rebuilt)
+        pm = PriceMatrix(directory)
+        dates = merged
+
+    new_dates = sorted({d for _, d, _ in entries if not dates or d > dates[-1]})
+    if new_dates:
+        # Append: én NaN-rad per ny handelsdag, fylles under
+        with open(pm.data_path, "ab") as f:
+            np.full((len(new_dates), capacity), np.nan, dtype=DTYPE).tofile(f)
+        dates += new_dates
+
+    date_index = {d: i for i, d in enumerate(dates)}
+    m = np.memmap(pm.data_path, dtype=DTYPE, mode="r+", shape=(len(dates), capacity))
+    for t in reset:
+        if t in pm.ticker_index:
+            m[:, ticker_index[t]] = np.nan  # gamle, ujusterte kurser ut
+    written = 0
+    for t, d, c in entries:
+        i = date_index.get(d)
+        if i is None or c is None:
+            continue
+        m[i, ticker_index[t]] = c
+        written += 1
+    m.flush()
+    del m
+    _write_meta(directory, capacity, tickers, dates, pm.data_file, pm.rebuilt)
+    return written
+
+
+def rebuild_from_history(conn: sqlite3.Connection, directory=PRICE_DIR):
+    """Bygger hele matrisen fra price_history (etter backfill)."""
+    import pandas as pd
+
+    with _locked(directory):
+        # Tidspunktet tas før lesingen: historikk skrevet etter dette regnes som ny
+        rebuilt = datetime.now(timezone.utc).isoformat()
+        # Leses under låsen: dager updatedb skrev før vi fikk den er med i historikken
+        hist = pd.read_sql("SELECT ticker, date, close FROM price_history", conn)
+        wide = hist.pivot(index="date", columns="ticker", values="close").sort_index()
+        tickers = list(wide.columns)
+        _create(directory, _capacity_for(len(tickers)), tickers, list(wide.index),
+                wide.to_numpy(dtype=DTYPE, na_value=np.nan), rebuilt)
+    return wide.shape
+
+
+if __name__ == "__main__":
+    from updatedb import get_conn
+
+    parser = argparse.ArgumentParser(description="Kursmatrise (memmap) for tverrsnittsberegninger og grafer.")
+    parser.add_argument("cmd", choices=["rebuild", "info"])
+    args = parser.parse_args()
+
+    if args.cmd == "rebuild":
+        conn = get_conn()
+        rows, cols = rebuild_from_history(conn)
+        conn.close()
+        print(f"✅ Kursmatrise bygget: {rows} dager × {cols} tickere.")
+    else:
+        pm = open_matrix()
+        if pm is None:
+            print("Ingen kursmatrise ennå (kjør: python pricematrix.py rebuild).")
+        else:
+            print(f"{len(pm.dates)} dager × {len(pm.tickers)} tickere (kapasitet {pm.capacity}), "
+                  f"{pm.dates[0] if pm.dates else '-'} – {pm.dates[-1] if pm.dates else '-'}")
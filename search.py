@@ -0,0 +1,131 @@
+import math
+import sqlite3
+
+# -------------------------
+# Søk i ticker og selskapsnavn (SQLite FTS5)
+# -------------------------
+# stock_search     – unicode61 med prefiksindeks: raske prefikstreff ("app" -> Apple, APP)
+# stock_search_tri – trigram: delstrenger og enkle skrivefeil ("alphbet" -> Alphabet)
+# Holdes i synk av updatedb.py via change_log (nye tickere og endrede navn).
+
+TICKER_WEIGHT = 10.0  # treff i ticker teller mer enn treff i navn
+MIN_TRIGRAM_OVERLAP = 0.5  # andel av søkets trigrammer et fuzzy-treff må ha
+
+
+def _has_trigram(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'stock_search_tri'"
+    ).fetchone() is not None
+
+
+def ensure_search_index(conn: sqlite3.Connection):
+    conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS stock_search USING fts5(
+        ticker, name, tokenize = 'unicode61', prefix = '1 2 3'
+    )""")
+    try:
+        conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS stock_search_tri USING fts5(
+            ticker, name, tokenize = 'trigram'
+        )""")
+    except sqlite3.OperationalError:
+        pass  # trigram krever SQLite 3.34+; da blir det bare prefikssøk
+
+
+def _tables(conn):
+    return ["stock_search", "stock_search_tri"] if _has_trigram(conn) else ["stock_search"]
+
+
+def rebuild_search_index(conn: sqlite3.Connection):
+    ensure_search_index(conn)
+    for table in _tables(conn):
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO {table} (ticker, name) SELECT ticker, COALESCE(name, '') FROM stock_data")
+
+
+def sync_search_index(conn: sqlite3.Connection, run_id):
+    """Oppdaterer indeksen for tickere som er nye eller har fått nytt navn i run_id."""
+    ensure_search_index(conn)
+    if conn.execute("SELECT 1 FROM stock_search LIMIT 1").fetchone() is None:
+        rebuild_search_index(conn)
+        return conn.execute("SELECT COUNT(*) FROM stock_data").fetchone()[0]
+
+    tickers = [(r[0],) for r in conn.execute(
+        "SELECT ticker FROM change_log WHERE run_id = ? AND field = 'name'", (run_id,)
+    )]
+    for table in _tables(conn):
+        conn.executemany(f"DELETE FROM {table} WHERE ticker = ?", tickers)
+        conn.executemany(f"""
+            INSERT INTO {table} (ticker, name)
+            SELECT ticker, COALESCE(name, '') FROM stock_data WHERE ticker = ?
+        """, tickers)
+    return len(tickers)
+
+
+def _terms(query):
+    return [t for t in "".join(c if c.isalnum() else " " for c in query).split() if t]
+
+
+def _trigrams(query):
+    q = "".join(c for c in query.lower() if c.isalnum() or c == " ")
+    return sorted({q[i:i + 3] for i in range(len(q) - 2) if " " not in q[i:i + 3]})
+
+
+def search(conn: sqlite3.Connection, query, limit=20, include_hidden=False):
+    """Rangerte treff: eksakt ticker, så prefiks, så trigram (fuzzy).
+    Returnerer [{ticker, name, hidden, match}]."""
+    terms = _terms(query)
+    if not terms:
+        return []
+    hidden_filter = "" if include_hidden else "AND (s.hidden IS NULL OR s.hidden = 0)"
+    results, seen = [], set()
+
+    def add(rows, match):
+        for ticker, name, hidden in rows:
+            if ticker not in seen and len(results) < limit:
+                seen.add(ticker)
+                results.append({"ticker": ticker, "name": name, "hidden": bool(hidden), "match": match})
+
+    add(conn.execute(
+        f"SELECT s.ticker, s.name, s.hidden FROM stock_data s WHERE s.ticker = ? {hidden_filter}",
+        (query.strip().upper(),),
+    ).fetchall(), "ticker")
+
+    try:
+        prefix = " AND ".join(f'"{t}"*' for t in terms)
+        add(conn.execute(f"""
+            SELECT s.ticker, s.name, s.hidden
+            FROM stock_search f JOIN stock_data s ON s.ticker = f.ticker
+            WHERE stock_search MATCH ? {hidden_filter}
+            ORDER BY bm25(stock_search, {TICKER_WEIGHT}, 1.0)
+            LIMIT ?
+        """, (prefix, limit)).fetchall(), "prefix")
+
+        grams = _trigrams(query)
+        if len(results) < limit and grams and _has_trigram(conn):
+            # Kandidater med minst ett felles trigram, så krav om nok overlapp
+            # -> tåler skrivefeil uten å ta med alt som deler tre bokstaver
+            fuzzy = " OR ".join(f'"{g}"' for g in grams)
+            rows = conn.execute(f"""
+                SELECT s.ticker, s.name, s.hidden
+                FROM stock_search_tri f JOIN stock_data s ON s.ticker = f.ticker
+                WHERE stock_search_tri MATCH ? {hidden_filter}
+                ORDER BY bm25(stock_search_tri, {TICKER_WEIGHT}, 1.0)
+                LIMIT ?
+            """, (fuzzy, limit * 10)).fetchall()
+            wanted = set(grams)
+            needed = max(min(2, len(wanted)), math.ceil(len(wanted) * MIN_TRIGRAM_OVERLAP))
+            scored = []
+            for row in rows:
+                common = len(wanted & set(_trigrams(f"{row[0]} {row[1] or ''}")))
+                if common >= needed:
+                    scored.append((-common, row))
+            add([row for _, row in sorted(scored, key=lambda x: x[0])], "fuzzy")
+    except sqlite3.OperationalError:
+        # Indeksen finnes ikke før første oppdatering: enkel LIKE på stock_data
+        like = f"%{query.strip()}%"
+        add(conn.execute(f"""
+            SELECT s.ticker, s.name, s.hidden FROM stock_data s
+            WHERE (s.ticker LIKE ? OR s.name LIKE ?) {hidden_filter}
+            ORDER BY s.ticker LIMIT ?
+        """, (like, like, limit)).fetchall(), "like")
+
+    return results
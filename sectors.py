@@ -0,0 +1,132 @@
+import sqlite3
+
+# -------------------------
+# Materialiserte aggregater per sektor og bransje
+# -------------------------
+# Oppdateres inkrementelt etter hver kjøring: bare grupper som har (eller hadde)
+# en ticker som endret seg i change_log regnes på nytt. Skjulte tickere telles
+# ikke med; appen regner om gruppene når en ticker skjules.
+
+LEVELS = ("sector", "industry")
+METRICS = {
+    "mom_1d": "mom_1d",
+    "mom_1m": "mom_1m",
+    "mom_3m": "mom_3m",
+    "mom_1y": "mom_1y",
+    "pb": "pb",
+    "pe": "pe",
+    "upside": "(target - price) / price * 100",
+}
+# Endringer i disse feltene påvirker aggregatene
+SOURCE_FIELDS = {"mom_1d", "mom_1m", "mom_3m", "mom_1y", "pb", "pe", "target", "price", "sector", "industry"}
+
+
+def stat_columns():
+    return [f"{m}_{s}" for m in METRICS for s in ("p25", "median", "p75")]
+
+
+def ensure_sector_table(conn: sqlite3.Connection):
+    cols = ",\n        ".join(f"{c} REAL" for c in stat_columns())
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS sector_stats (
+        level TEXT NOT NULL,     -- 'sector' eller 'industry'
+        name TEXT NOT NULL,
+        n INTEGER,
+        {cols},
+        run_id INTEGER,
+        PRIMARY KEY (level, name)
+    )""")
+
+
+def percentile(sorted_values, q):
+    """Lineær interpolasjon (samme som numpy sin standard)."""
+    if not sorted_values:
+        return None
+    pos = (len(sorted_values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def _group_stats(conn, level, name):
+    exprs = ", ".join(METRICS.values())
+    rows = conn.execute(
+        f"SELECT {exprs} FROM stock_data WHERE {level} = ? AND price IS NOT NULL "
+        "AND (hidden IS NULL OR hidden = 0)", (name,)
+    ).fetchall()
+    stats = []
+    for i in range(len(METRICS)):
+        values = sorted(r[i] for r in rows if r[i] is not None)
+        stats += [percentile(values, 0.25), percentile(values, 0.5), percentile(values, 0.75)]
+    return len(rows), stats
+
+
+def _affected_groups(conn, run_id):
+    fields = sorted(SOURCE_FIELDS)
+    tickers = [r[0] for r in conn.execute(
+        f"SELECT DISTINCT ticker FROM change_log WHERE run_id = ? AND field IN ({','.join('?' * len(fields))})",
+        [run_id] + fields,
+    )]
+    groups = set()
+    for i in range(0, len(tickers), 500):
+        chunk = tickers[i:i + 500]
+        for sector, industry in conn.execute(
+            f"SELECT sector, industry FROM stock_data WHERE ticker IN ({','.join('?' * len(chunk))})", chunk
+        ):
+            groups.add(("sector", sector))
+            groups.add(("industry", industry))
+    # Tickere som byttet gruppe må også fjernes fra den gamle
+    for field, old in conn.execute(
+        "SELECT field, old_value FROM change_log WHERE run_id = ? AND field IN ('sector', 'industry')", (run_id,)
+    ):
+        groups.add((field, old))
+    return {(level, name) for level, name in groups if name}
+
+
+def _all_groups(conn):
+    groups = set()
+    for level in LEVELS:
+        for (name,) in conn.execute(f"SELECT DISTINCT {level} FROM stock_data WHERE {level} IS NOT NULL"):
+            groups.add((level, name))
+    for level, name in conn.execute("SELECT level, name FROM sector_stats"):
+        groups.add((level, name))
+    return groups
+
+
+def refresh_sector_stats(conn: sqlite3.Connection, run_id, full=False):
+    """Regner om aggregatene for gruppene berørt av run_id (alt ved full=True
+    eller tom tabell). Returnerer antall grupper som ble oppdatert."""
+    ensure_sector_table(conn)
+    empty = conn.execute("SELECT 1 FROM sector_stats LIMIT 1").fetchone() is None
+    groups = _all_groups(conn) if full or empty else _affected_groups(conn, run_id)
+
+    for level, name in groups:
+        _store_group(conn, level, name, run_id)
+    return len(groups)
+
+
+def _store_group(conn, level, name, run_id):
+    n, stats = _group_stats(conn, level, name)
+    if n == 0:
+        conn.execute("DELETE FROM sector_stats WHERE level = ? AND name = ?", (level, name))
+        return
+    cols = stat_columns()
+    conn.execute(
+        f"INSERT OR REPLACE INTO sector_stats (level, name, n, {', '.join(cols)}, run_id) "
+        f"VALUES (?, ?, ?, {', '.join('?' * len(cols))}, ?)",
+        [level, name, n] + stats + [run_id],
+    )
+
+
+def refresh_ticker_groups(conn: sqlite3.Connection, ticker):
+    """Regner om sektoren og bransjen til én ticker (f.eks. når den skjules i appen)."""
+    ensure_sector_table(conn)
+    row = conn.execute(f"SELECT {', '.join(LEVELS)} FROM stock_data WHERE ticker = ?", (ticker,)).fetchone()
+    if row is None:
+        return 0
+    groups = [(level, name) for level, name in zip(LEVELS, row) if name]
+    for level, name in groups:
+        run_id = conn.execute(
+            "SELECT run_id FROM sector_stats WHERE level = ? AND name = ?", (level, name)
+        ).fetchone()
+        _store_group(conn, level, name, run_id[0] if run_id else None)
+    return len(groups)
@@ -0,0 +1,47 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+# -------------------------
+# Forhåndsbygget første side (standardvisningen sortert på targetPercent)
+# -------------------------
+# Skrives av updatedb.py etter hver kjøring og vises av app.py med én gang
+# mens full data lastes. Bare standardbiblioteket, så det er billig å importere.
+
+SNAPSHOT_PATH = "snapshot.json"
+SNAPSHOT_ROWS = 10  # = PAGE_SIZE i app.py
+SNAPSHOT_COLUMNS = ["ticker", "name", "price", "targetPercent", "mom_1m", "mom_1y"]
+
+
+def write_snapshot(conn: sqlite3.Connection, path=SNAPSHOT_PATH, rows=SNAPSHOT_ROWS):
+    cur = conn.execute("""
+        SELECT ticker, name, price,
+               (target - price) / price * 100 AS targetPercent,
+               mom_1m, mom_1y
+        FROM stock_data
+        WHERE (hidden IS NULL OR hidden = 0) AND price IS NOT NULL
+        ORDER BY targetPercent IS NULL, targetPercent DESC
+        LIMIT ?
+    """, (rows,))
+    data = {
+        "generated": datetime.now(timezone.utc).isoformat(),
+        "rows": [
+            {c: (round(v, 2) if isinstance(v, float) else v) for c, v in zip(SNAPSHOT_COLUMNS, r)}
+            for r in cur.fetchall()
+        ],
+    }
+    # Skriv til midlertidig fil og bytt inn, så appen aldri leser en halv fil
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return len(data["rows"])
+
+
+def read_snapshot(path=SNAPSHOT_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
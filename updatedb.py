@@ -1,3 +1,4 @@
+import argparse
 import sqlite3
 import yfinance as yf
 import requests
@@ -6,6 +7,16 @@ from bs4 import BeautifulSoup
 from datetime import datetime, timezone
 from io import StringIO
 
+from changefeed import start_run, finish_run, diff_row, record_changes
+from alerts import evaluate_alerts
+from sectors import refresh_sector_stats
+from snapshot import write_snapshot
+from history import bars_from_frame
+from indicators import INDICATOR_COLUMNS, update_indicators
+from pricematrix import open_matrix, write_closes
+from search import sync_search_index
+from calendars import SUFFIXES, load_last_fetch, needs_refresh, save_last_fetch
+
 DB_PATH = "aksjeradar.db"
 
 def get_conn():
@@ -13,6 +24,21 @@ def get_conn():
     conn.execute("PRAGMA journal_mode=WAL;")
     return conn
 
+# Kolonner lagt til etter at tabellen ble laget (migreres med ALTER TABLE)
+EXTRA_COLUMNS = {
+    "sector": "TEXT",
+    "industry": "TEXT",
+    **{c: "REAL" for c in INDICATOR_COLUMNS},
+}
+
+def ensure_columns(conn):
+    existing = {r[1] for r in conn.execute("PRAGMA table_info(stock_data)")}
+    for col, decl in EXTRA_COLUMNS.items():
+        if col not in existing:
+            conn.execute(f"ALTER TABLE stock_data ADD COLUMN {col} {decl}")
+    conn.execute("CREATE INDEX IF NOT EXISTS stock_data_sector ON stock_data (sector)")
+    conn.execute("CREATE INDEX IF NOT EXISTS stock_data_industry ON stock_data (industry)")
+
 # -------------------------
 # 1️⃣ Hent eksisterende tickere
 # -------------------------
@@ -36,8 +62,17 @@ def get_existing_tickers():
         targetHigh REAL,
         marketcap REAL,
         name TEXT,
-        hidden INTEGER DEFAULT 0  -- NY: skjult flagg, 0 = synlig, 1 = skjult
+        hidden INTEGER DEFAULT 0,  -- NY: skjult flagg, 0 = synlig, 1 = skjult
+        sector TEXT,
+        industry TEXT,
+        sma50_dist REAL,
+        sma200_dist REAL,
+        rsi_14 REAL,
+        vol_20d REAL,
+        drawdown_52w REAL,
+        avg_volume_20d REAL
     )""")
+    ensure_columns(conn)
     conn.commit()
     cursor.execute("SELECT ticker FROM stock_data")
     rows = cursor.fetchall()
@@ -133,33 +168,43 @@ def get_all_tickers():
     finviz_active = get_finviz_top("ta_mostactive")
 
     all_tickers = set(existing + yahoo_US + yahoo_CA + yahoo_GB + finviz_top + finviz_active)
-    all_tickers = [t for t in all_tickers if t.isalpha()]  # kun bokstaver (fjerner rare symboler)
+    # kun bokstaver (fjerner rare symboler), evt. med kjent børssuffiks (.TO, .L, ...)
+    all_tickers = [t for t in all_tickers if t.isalpha() or (
+        "." in t and t.split(".", 1)[0].isalpha() and "." + t.split(".", 1)[1] in SUFFIXES
+    )]
     print(f"Totalt {len(all_tickers)} tickere (inkludert eksisterende og trendende).")
     return all_tickers
 
 # -------------------------
 # 5️⃣ Beregn momentum for en ticker
 # -------------------------
-def calculate_momentum(ticker):
+def calculate_momentum(ticker, hist=None):
     try:
-        tk = yf.Ticker(ticker)
-        hist = tk.history(period="2y")
+        if hist is None:
+            hist = yf.Ticker(ticker).history(period="2y")
         if hist.empty:
             return None, None, None, None, None
 
+        close = hist["Close"].dropna()
+        if close.empty:
+            return None, None, None, None, None
+
         # Siste pris
-        latest = hist["Close"].iloc[-1]
+        latest = close.iloc[-1]
 
-        def pct_change(days):
-            if len(hist) < days + 1:
+        def pct_change_since(offset):
+            # Siste sluttkurs på eller før datoen `offset` tilbake (kalenderdato,
+            # ikke antall rader – børsene har ulike helligdager)
+            target = close.index[-1] - offset
+            if close.index[0] > target:
                 return None
-            old_price = hist["Close"].iloc[-(days + 1)]
+            old_price = close.asof(target)
             return ((latest - old_price) / old_price) * 100
 
-        mom_1d = pct_change(1)
-        mom_1m = pct_change(22)   # ~22 handelsdager
-        mom_3m = pct_change(66)   # ~66 handelsdager
-        mom_1y = pct_change(252)  # ~1 handelsår
+        mom_1d = ((latest - close.iloc[-2]) / close.iloc[-2]) * 100 if len(close) > 1 else None
+        mom_1m = pct_change_since(pd.DateOffset(months=1))
+        mom_3m = pct_change_since(pd.DateOffset(months=3))
+        mom_1y = pct_change_since(pd.DateOffset(years=1))
 
         return latest, mom_1d, mom_1m, mom_3m, mom_1y
 
@@ -170,76 +215,167 @@ def calculate_momentum(ticker):
 # -------------------------
 # 6️⃣ Hent data fra yfinance og oppdater DB
 # -------------------------
-def update_database():
+# Feltene som skrives per ticker (i tillegg til ticker og timestamp)
+MATRIX_DAYS = 5  # dager per ticker som skrives til kursmatrisen hver kjøring
+MATRIX_SEED_DAYS = 252  # færre dager i matrisen -> skriv hele hist (ny ticker)
+
+FIELDS = [
+    "pe", "pb", "debt_to_equity", "dividend_yield",
+    "mom_1d", "mom_1y", "mom_1m", "mom_3m",
+    "price", "target", "targetLow", "targetHigh", "marketcap", "name",
+    "sector", "industry",
+] + INDICATOR_COLUMNS
+
+def load_current_rows(cursor):
+    cursor.execute(f"SELECT ticker, {', '.join(FIELDS)} FROM stock_data")
+    return {r[0]: dict(zip(FIELDS, r[1:])) for r in cursor.fetchall()}
+
+def upsert_sql():
+    cols = ["ticker", "timestamp"] + FIELDS
+    updates = ",\n                    ".join(f"{c}=excluded.{c}" for c in cols[1:])
+    return f"""
+                INSERT INTO stock_data ({', '.join(cols)})
+                VALUES ({', '.join('?' * len(cols))})
+                ON CONFLICT(ticker) DO UPDATE SET
+                    {updates}
+                    -- NY: hidden endres IKKE
+            """
+
+def update_database(force=False):
     tickers = get_all_tickers()
     conn = get_conn()
     cursor = conn.cursor()
     ts = datetime.now(timezone.utc)
 
+    # Hopp over tickere der børsen ikke har handlet siden forrige henting
+    last_fetch = load_last_fetch(conn)
+    if not force:
+        due = [t for t in tickers if needs_refresh(t, last_fetch.get(t), ts)]
+        print(f"🗓️ {len(due)} av {len(tickers)} tickere kan ha nye data (resten: børs stengt siden sist).")
+        tickers = due
+
+    current = load_current_rows(cursor)
+    run_id = start_run(conn, ts)
+    conn.commit()  # ingen skrivetransaksjon åpen mens vi venter på yfinance
+    sql = upsert_sql()
+    changed = 0
+    matrix_entries = []
+    matrix_reset = []
+    pm = open_matrix()
+    matrix_filled = pm.filled() if pm is not None else {}
+
     for t in tickers:
         try:
             tk = yf.Ticker(t)
             info = tk.info
 
-            price, mom_1d, mom_1m, mom_3m, mom_1y = calculate_momentum(t)
+            hist = tk.history(period="2y")
+            price, mom_1d, mom_1m, mom_3m, mom_1y = calculate_momentum(t, hist)
             if not price:
                 continue  # hopp over tickere uten pris
 
-            data = (
-                t,
-                ts,
-                info.get("trailingPE"),
-                info.get("priceToBook"),
-                info.get("debtToEquity"),
-                info.get("dividendYield"),
-                mom_1d,
-                mom_1y,
-                mom_1m,
-                mom_3m,
-                price,
-                info.get("targetMeanPrice"),
-                info.get("targetLowPrice"),
-                info.get("targetHighPrice"),
-                info.get("marketCap"),
-                info.get("shortName", "")
-                # NY: hidden beholdes via INSERT OR REPLACE, vi setter ikke den her
-            )
-
-            cursor.execute("""
-                INSERT INTO stock_data (ticker, timestamp, pe, pb, debt_to_equity, dividend_yield,
-                    mom_1d, mom_1y, mom_1m, mom_3m, price, target, targetLow,
-                    targetHigh, marketcap, name)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(ticker) DO UPDATE SET
-                    timestamp=excluded.timestamp,
-                    pe=excluded.pe,
-                    pb=excluded.pb,
-                    debt_to_equity=excluded.debt_to_equity,
-                    dividend_yield=excluded.dividend_yield,
-                    mom_1d=excluded.mom_1d,
-                    mom_1y=excluded.mom_1y,
-                    mom_1m=excluded.mom_1m,
-                    mom_3m=excluded.mom_3m,
-                    price=excluded.price,
-                    target=excluded.target,
-                    targetLow=excluded.targetLow,
-                    targetHigh=excluded.targetHigh,
-                    marketcap=excluded.marketcap,
-                    name=excluded.name
-                    -- NY: hidden endres IKKE
-            """)
+            row = {
+                "pe": info.get("trailingPE"),
+                "pb": info.get("priceToBook"),
+                "debt_to_equity": info.get("debtToEquity"),
+                "dividend_yield": info.get("dividendYield"),
+                "mom_1d": mom_1d,
+                "mom_1y": mom_1y,
+                "mom_1m": mom_1m,
+                "mom_3m": mom_3m,
+                "price": float(price),
+                "target": info.get("targetMeanPrice"),
+                "targetLow": info.get("targetLowPrice"),
+                "targetHigh": info.get("targetHighPrice"),
+                "marketcap": info.get("marketCap"),
+                "name": info.get("shortName", ""),
+                "sector": info.get("sector"),
+                "industry": info.get("industry"),
+            }
+            # Skrivingen for én ticker er én kort transaksjon: låsen holdes bare
+            # mens vi skriver, ikke under nettverkskallene (backfill.py, appen og
+            # alerts.py kan skrive i mellomtiden). Feiler noe, rulles alt for
+            # tickeren tilbake og last_fetch lagres ikke -> prøves neste kjøring.
+            with conn:
+                # Nye dager -> price_history, indikatorer oppdateres i O(1) per dag
+                bars = bars_from_frame(t, hist)
+                indicator_values, recomputed = update_indicators(conn, t, bars)
+                row.update(indicator_values)
+
+                # Sammenlign med lagret rad: ingen endring -> ingen skriving
+                changes = diff_row(current.get(t), row)
+                if changes:
+                    cursor.execute(sql, [t, str(ts)] + [row[f] for f in FIELDS])
+                    record_changes(conn, run_id, t, changes)
+                save_last_fetch(conn, [t], ts)
+
+            # Siste dager til kursmatrisen (overskriver evt. uferdig dag fra forrige kjøring);
+            # nye tickere sås med hele 2y-historikken som allerede er lastet ned, og
+            # etter en splitt (full omregning) byttes hele kolonnen ut med justerte kurser
+            if recomputed and t in matrix_filled:
+                matrix_reset.append(t)
+            seed = recomputed or matrix_filled.get(t, 0) < MATRIX_SEED_DAYS
+            matrix_entries += [(t, b[1], b[5]) for b in (bars if seed else bars[-MATRIX_DAYS:])]
 
-            print(f"✅ Oppdatert {t}")
+            if not changes:
+                print(f"➖ Uendret {t}")
+                continue
+            changed += 1
+            print(f"✅ Oppdatert {t} ({', '.join(changes)})")
 
         except Exception as e:
             print(f"⚠️ Feil ved {t}: {e}")
 
+    finish_run(conn, run_id, len(tickers), changed)
     conn.commit()
+
+    # Søkeindeks (FTS5): nye tickere og endrede navn
+    try:
+        synced = sync_search_index(conn, run_id)
+        conn.commit()
+        if synced:
+            print(f"🔍 Søkeindeks oppdatert for {synced} tickere.")
+    except Exception as e:
+        print(f"⚠️ Feil ved søkeindeks: {e}")
+
+    # Sektor-/bransjeaggregater: bare grupper berørt av denne kjøringen
+    try:
+        groups = refresh_sector_stats(conn, run_id)
+        conn.commit()
+        print(f"📊 Oppdatert aggregater for {groups} sektorer/bransjer.")
+    except Exception as e:
+        print(f"⚠️ Feil ved sektoraggregater: {e}")
+
+    # Kursmatrise (memmap) for tverrsnitt og grafer
+    try:
+        write_closes(matrix_entries, reset=matrix_reset)
+    except Exception as e:
+        print(f"⚠️ Feil ved kursmatrise: {e}")
+
+    # Forhåndsbygget første side for rask kaldstart i appen
+    try:
+        write_snapshot(conn)
+    except Exception as e:
+        print(f"⚠️ Feil ved snapshot: {e}")
+
+    # Varsler: bare regler/tickere berørt av endringene i denne kjøringen
+    try:
+        fired = evaluate_alerts(conn, run_id)
+        conn.commit()
+        if fired:
+            print(f"🔔 {fired} nye varsler i alert_outbox.")
+    except Exception as e:
+        print(f"⚠️ Feil ved varsler: {e}")
+
     conn.close()
-    print("✅ Ferdig oppdatert database.")
+    print(f"✅ Ferdig oppdatert database (kjøring {run_id}: {changed} endret, {len(tickers) - changed} uendret/hoppet over).")
+    return run_id
 
 # -------------------------
 # 7️⃣ Kjør skriptet
 # -------------------------
 if __name__ == "__main__":
-    update_database()
+    parser = argparse.ArgumentParser(description="Oppdater aksjeradar.db")
+    parser.add_argument("--force", action="store_true", help="Hent alle tickere, også når børsen har vært stengt")
+    args = parser.parse_args()
+    update_database(force=args.force)